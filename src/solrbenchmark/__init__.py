@@ -1,18 +1,41 @@
 """Tools for running Solr benchmarking tests."""
+import importlib
 import sys
+from types import ModuleType
+from typing import List
 
 if sys.version_info >= (3, 8):
     from importlib import metadata
 else:
     import importlib_metadata as metadata
 
-from . import docs
-from . import runner
-from . import schema
-from . import terms
-
 
 __version__ = metadata.version('solrbenchmark')
 __all__ = [
     'docs', 'runner', 'schema', 'terms'
 ]
+
+
+def __getattr__(name: str) -> ModuleType:
+    """Imports submodules lazily, on first attribute access.
+
+    Importing the top-level package does not import every submodule
+    (and all of their dependencies) up front; each one is imported the
+    first time it is accessed as `solrbenchmark.<name>`.
+
+    Args:
+        name: The name of the attribute being accessed.
+
+    Returns:
+        The submodule named by `name`.
+    """
+    if name in __all__:
+        module = importlib.import_module(f'.{name}', __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__() -> List[str]:
+    """Includes lazily-imported submodules in `dir(solrbenchmark)`."""
+    return sorted(set(globals()) | set(__all__))
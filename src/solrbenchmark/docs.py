@@ -1,19 +1,31 @@
 """Tools for making, saving, and loading sets of documents."""
+from collections import Counter
+from functools import partial
+from itertools import repeat
+import os
 from pathlib import Path
 from typing import (
-    Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple,
-    Type, TypeVar, Union
+    Any, Dict, IO, Iterable, Iterator, List, Mapping, Optional,
+    Sequence, Tuple, Type, TypeVar, Union
 )
 
 from solrbenchmark.localtypes import (
     FacetValueCountsArg, FacetValueCountsReturn, PathLike
 )
 from solrbenchmark.schema import BenchmarkSchema
-import ujson
+import orjson
 
 
 D = TypeVar('D', bound='DocSet')
 
+# Number of bytes read from a 'docs' file at a time when iterating
+# through saved docs.
+_DOCS_READ_SIZE = 1 << 20
+
+# Number of bytes of serialized docs buffered before being written to
+# a 'docs' file when streaming docs to disk.
+_DOCS_WRITE_SIZE = 1 << 20
+
 
 def compose_terms_json_filepath(basepath: PathLike, docset_id: str) -> Path:
     """Get the full filepath to a 'terms' json file for a docset.
@@ -28,7 +40,7 @@ def compose_terms_json_filepath(basepath: PathLike, docset_id: str) -> Path:
         A pathlib.Path object representing the full path to the 'terms'
         json file.
     """
-    return Path(basepath) / f'{docset_id}_terms.json'
+    return Path(basepath, f'{docset_id}_terms.json')
 
 
 def compose_docs_json_filepath(basepath: PathLike, docset_id: str) -> Path:
@@ -44,7 +56,7 @@ def compose_docs_json_filepath(basepath: PathLike, docset_id: str) -> Path:
         A pathlib.Path object representing the full path to the 'docs'
         json file.
     """
-    return Path(basepath) / f'{docset_id}_docs.json'
+    return Path(basepath, f'{docset_id}_docs.json')
 
 
 def compose_counts_json_filepath(basepath: PathLike, docset_id: str) -> Path:
@@ -60,45 +72,71 @@ def compose_counts_json_filepath(basepath: PathLike, docset_id: str) -> Path:
         A pathlib.Path object representing the full path to the
         'counts' json file.
     """
-    return Path(basepath) / f'{docset_id}_counts.json'
+    return Path(basepath, f'{docset_id}_counts.json')
 
 
 def _is_file_empty(fpath: PathLike) -> bool:
     """Returns True if a file is empty or does not exist."""
     try:
-        fh = open(fpath, 'r')
+        return os.stat(fpath).st_size == 0
     except FileNotFoundError:
         return True
-    with fh:
-        return not bool(fh.readline())
 
 
 def _get_data(fpath: PathLike) -> Dict[str, Any]:
     """Gets JSON data from a filepath and returns it as a dict."""
     try:
-        fh = open(fpath, 'r')
+        fh = open(fpath, 'rb')
     except FileNotFoundError:
         return {}
     with fh:
         try:
-            return ujson.loads(fh.read())
-        except ujson.JSONDecodeError:
+            return orjson.loads(fh.read())
+        except orjson.JSONDecodeError:
             return {}
 
 
-def _update_data(fpath: PathLike, user_data: Dict[str, Any]) -> Dict[str, Any]:
+def _get_file_version(fpath: PathLike) -> Optional[Tuple[int, int]]:
+    """Returns a (size, mtime) tuple for a file, or None if missing.
+
+    Comparing these is a cheap way to tell whether a file has been
+    changed since it was last read or written.
+    """
+    try:
+        stat = os.stat(fpath)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _sync_file(fh: IO[Any]) -> None:
+    """Flushes the given file and syncs it to disk."""
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def _update_data(fpath: PathLike,
+                 user_data: Dict[str, Any],
+                 data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Updates JSON data at a filepath with the given user_data (dict).
 
     The updated JSON is saved and the new data is returned as a dict.
     If a value in `user_data` is None, the existing value for that key
-    remains untouched.
+    remains untouched. If the existing data is already in memory, pass
+    it as `data` to skip reading it from the file; it is updated in
+    place. If no value in `user_data` is None, the existing data is
+    replaced outright, so the file is not read.
     """
-    data = _get_data(fpath)
+    if data is None:
+        if all(val is not None for val in user_data.values()):
+            data = {}
+        else:
+            data = _get_data(fpath)
     for key, val in user_data.items():
         if val is not None:
             data[key] = val
-    with open(fpath, 'w') as fh:
-        fh.write(ujson.dumps(data))
+    with open(fpath, 'wb') as fh:
+        fh.write(orjson.dumps(data))
     return data
 
 
@@ -158,6 +196,10 @@ class FileSet:
         self._terms_fpath = compose_terms_json_filepath(basepath, docset_id)
         self._docs_fpath = compose_docs_json_filepath(basepath, docset_id)
         self._counts_fpath = compose_counts_json_filepath(basepath, docset_id)
+        self._terms_data: Optional[Dict[str, Any]] = None
+        self._counts_data: Optional[Dict[str, Any]] = None
+        self._terms_version: Optional[Tuple[int, int]] = None
+        self._counts_version: Optional[Tuple[int, int]] = None
         self._search_terms: Optional[List[str]] = None
         self._facet_terms: Optional[Dict[str, List[str]]] = None
         self._total_docs: int = 0
@@ -241,7 +283,7 @@ class FileSet:
 
         See the `search_terms` attribute.
         """
-        if self._search_terms is None:
+        if self._terms_changed():
             self._refresh_terms()
         return self._search_terms
 
@@ -251,7 +293,7 @@ class FileSet:
 
         See the `facet_terms` attribute.
         """
-        if self._facet_terms is None:
+        if self._terms_changed():
             self._refresh_terms()
         return self._facet_terms
 
@@ -261,7 +303,7 @@ class FileSet:
 
         See the `total_docs` attribute.
         """
-        if self._total_docs == 0:
+        if self._counts_changed():
             self._refresh_counts()
         return self._total_docs
 
@@ -285,7 +327,7 @@ class FileSet:
 
         See the `facet_value_counts` attribute.
         """
-        if self._facet_value_counts is None:
+        if self._counts_changed():
             self._refresh_counts()
         return self._facet_value_counts
 
@@ -296,23 +338,51 @@ class FileSet:
         See the `docs` attribute.
         """
         try:
-            fh = self._docs_fpath.open('r')
+            fh = self._docs_fpath.open('rb')
         except FileNotFoundError:
-            return iter([])
+            return
         with fh:
-            for jsonline in fh:
-                yield ujson.loads(jsonline)
-
-    def _refresh_terms(self, data: Optional[Mapping[str, Any]] = None) -> None:
+            # Read large blocks and split them into lines ourselves,
+            # carrying any incomplete last line over to the next block.
+            tail = b''
+            for block in iter(partial(fh.read, _DOCS_READ_SIZE), b''):
+                jsonlines = (tail + block).split(b'\n')
+                tail = jsonlines.pop()
+                for jsonline in jsonlines:
+                    yield orjson.loads(jsonline)
+            if tail:
+                yield orjson.loads(tail)
+
+    def _terms_changed(self) -> bool:
+        """True if 'terms' has changed since it was last loaded."""
+        return (self._terms_data is None
+                or _get_file_version(self._terms_fpath) != self._terms_version)
+
+    def _refresh_terms(self, data: Optional[Dict[str, Any]] = None) -> None:
         """Refreshes terms from the file or from the provided data."""
-        data = data or _get_data(self._terms_fpath)
+        # Get the version before reading, so that a change made while
+        # reading is caught the next time rather than missed.
+        self._terms_version = _get_file_version(self._terms_fpath)
+        if data is None:
+            data = _get_data(self._terms_fpath)
+        self._terms_data = data
         self._search_terms = data.get('search_terms')
         self._facet_terms = data.get('facet_terms')
 
-    def _refresh_counts(self,
-                        data: Optional[Mapping[str, Any]] = None) -> None:
+    def _counts_changed(self) -> bool:
+        """True if 'counts' has changed since it was last loaded."""
+        return (self._counts_data is None
+                or _get_file_version(self._counts_fpath)
+                != self._counts_version)
+
+    def _refresh_counts(self, data: Optional[Dict[str, Any]] = None) -> None:
         """Refreshes counts from the file or from the provided data."""
-        data = data or _get_data(self._counts_fpath)
+        # Get the version before reading, so that a change made while
+        # reading is caught the next time rather than missed.
+        self._counts_version = _get_file_version(self._counts_fpath)
+        if data is None:
+            data = _get_data(self._counts_fpath)
+        self._counts_data = data
         self._total_docs = data.get('total_docs', 0)
         self._facet_value_counts = data.get('facet_value_counts')
 
@@ -336,10 +406,11 @@ class FileSet:
                 the 'terms' file will remain unchanged. Pass an empty
                 mapping to clear facet terms in the file.
         """
+        data = None if self._terms_changed() else self._terms_data
         data = _update_data(self._terms_fpath, {
             'search_terms': search_terms,
             'facet_terms': facet_terms
-        })
+        }, data)
         self._refresh_terms(data)
 
     def save_counts(self,
@@ -361,15 +432,17 @@ class FileSet:
                 the facet value counts for a set of documents. If None,
                 the facet_value_counts in 'counts' remains unchanged.
         """
+        data = None if self._counts_changed() else self._counts_data
         data = _update_data(self._counts_fpath, {
             'total_docs': total_docs,
             'facet_value_counts': facet_value_counts
-        })
+        }, data)
         self._refresh_counts(data)
 
     def stream_docs_to_file(self,
                             docs: Iterable[Dict[str, Any]],
-                            overwrite: bool = True
+                            overwrite: bool = True,
+                            fsync_every: Optional[int] = None
                             ) -> Iterator[Dict[str, Any]]:
         """Create an iterator that saves docs to disk as it iterates.
 
@@ -380,18 +453,63 @@ class FileSet:
             overwrite: (Optional.) If True, the existing 'docs' file is
                 overwritten at the start of iteration. Otherwise, the
                 existing file is appended to. Default is True.
+            fsync_every: (Optional.) If set, docs are written, flushed,
+                and synced to disk (via `os.fsync`) once per this many
+                docs, rather than whenever the OS decides to write them
+                back. Any remaining docs are also synced when iteration
+                stops. Must be at least 1 if given; a ValueError is
+                raised otherwise. Default is None (never sync
+                explicitly).
 
         Returns:
             An iterator that yields each doc in `docs` but saves the
-            document to disk (the 'docs' file) before yielding. Saves
-            documents one at a time, as you iterate. (If you fail to
-            iterate, the documents are not saved.)
-        """
-        mode = 'w' if overwrite else 'a'
+            document to disk (the 'docs' file) as it goes. Documents
+            are serialized one at a time, as you iterate, and written
+            to the file whenever enough have been buffered. Any
+            buffered docs are written when iteration stops. (If you
+            fail to iterate, the documents are not saved.)
+        """
+        # Check this up front, rather than on the first iteration.
+        if fsync_every is not None and fsync_every < 1:
+            raise ValueError(
+                f"The 'fsync_every' argument must be at least 1; "
+                f"`{fsync_every}` was given."
+            )
+        return self._stream_docs(docs, overwrite, fsync_every)
+
+    def _stream_docs(self,
+                     docs: Iterable[Dict[str, Any]],
+                     overwrite: bool,
+                     fsync_every: Optional[int]
+                     ) -> Iterator[Dict[str, Any]]:
+        """Implements `stream_docs_to_file` (as a generator)."""
+        mode = 'wb' if overwrite else 'ab'
         with self._docs_fpath.open(mode) as fh:
-            for doc in docs:
-                fh.write(f'{ujson.dumps(doc)}\n')
-                yield doc
+            # Bind these to locals, since this loop runs once per doc.
+            buf = bytearray()
+            dumps = orjson.dumps
+            option = orjson.OPT_APPEND_NEWLINE
+            buf_size = _DOCS_WRITE_SIZE
+            unsynced = 0
+            try:
+                for doc in docs:
+                    buf += dumps(doc, option=option)
+                    if len(buf) >= buf_size:
+                        fh.write(buf)
+                        buf.clear()
+                    if fsync_every:
+                        unsynced += 1
+                        if unsynced >= fsync_every:
+                            fh.write(buf)
+                            buf.clear()
+                            _sync_file(fh)
+                            unsynced = 0
+                    yield doc
+            finally:
+                if buf:
+                    fh.write(buf)
+                if unsynced:
+                    _sync_file(fh)
 
     def clear(self) -> None:
         """Clears out this FileSet and deletes all three files."""
@@ -399,13 +517,18 @@ class FileSet:
         # On 3.8+, we can use `fpath.unlink(missing_ok=True)` to
         # try to delete the file while silencing "not found" errors.
         # But this is not available on 3.7. So we have to catch and
-        # ignore the error, instead.
-        try:
-            self._terms_fpath.unlink()
-            self._docs_fpath.unlink()
-            self._counts_fpath.unlink()
-        except FileNotFoundError:
-            pass
+        # ignore the error, instead -- for each file separately, so
+        # that one missing file doesn't keep the others from being
+        # deleted.
+        for fpath in self.filepaths:
+            try:
+                fpath.unlink()
+            except FileNotFoundError:
+                pass
+        self._terms_data = None
+        self._counts_data = None
+        self._terms_version = None
+        self._counts_version = None
         self._search_terms = None
         self._facet_terms = None
         self._total_docs = 0
@@ -504,11 +627,17 @@ class SchemaToFileSetLikeAdapter:
             iterator is generated: 'w' (new docs overwrite existing),
             'a' (new docs append to existing), or anything else (docs
             are read from the existing file).
+        fsync_every: If docs are being saved to disk, this is passed
+            to `FileSet.stream_docs_to_file` when new docs are
+            generated: if set, docs are synced to disk (via `os.fsync`)
+            once per this many docs. None (the default) means docs are
+            never synced explicitly.
     """
     def __init__(self,
                  docset_id: str,
                  schema: BenchmarkSchema,
-                 savepath: Optional[PathLike] = None) -> None:
+                 savepath: Optional[PathLike] = None,
+                 fsync_every: Optional[int] = None) -> None:
         """Inits a SchemaToFileSetAdapter instance.
 
         Args:
@@ -522,6 +651,7 @@ class SchemaToFileSetLikeAdapter:
                 search terms, docs, and facet counts are saved there as
                 schema docs are generated. If not provided, schema data
                 does not get saved to disk.
+            fsync_every: (Optional.) See `fsync_every` attribute.
         """
         self._docset_id = docset_id
         if schema.num_docs is None:
@@ -533,6 +663,8 @@ class SchemaToFileSetLikeAdapter:
         self._schema = schema
         facet_fields = schema.facet_fields.values()
         self._facet_terms = {f.name: f.terms for f in facet_fields}
+        self._facet_names = tuple(self._facet_terms)
+        self.fsync_every = fsync_every
         if savepath is None:
             self._fileset = None
             self.file_action = None
@@ -546,32 +678,34 @@ class SchemaToFileSetLikeAdapter:
         """Configures and returns a basic docs iterator."""
         self._total_docs = 0
         self._facet_value_counts: Dict[str, List[Tuple[str, int]]] = {}
-        self._facet_value_groups: Dict[str, Dict[str, int]] = {}
+        self._facet_value_groups: Dict[str, 'Counter[str]'] = {
+            fname: Counter() for fname in self._facet_names
+        }
         self._schema.reset_fields()
-        for _ in range(self._schema.num_docs or 0):
-            doc = self._schema()
-            self._update_tallies(doc)
+        # Tallies are updated inline, with everything the loop needs
+        # bound to locals, since this runs once per generated doc.
+        num_docs = self._schema.num_docs or 0
+        make_doc = self._schema
+        groups = tuple(self._facet_value_groups.items())
+        for _ in repeat(None, num_docs):
+            doc = make_doc()
+            for fname, fval_group in groups:
+                raw = doc.get(fname)
+                if not raw:
+                    continue
+                if isinstance(raw, (list, tuple)):
+                    fval_group.update(raw)
+                else:
+                    fval_group[raw] += 1
+            self._total_docs += 1
+            if self._total_docs == num_docs:
+                self._finalize_facet_counts()
             yield doc
 
-    def _update_tallies(self, doc: Mapping[str, Any]) -> None:
-        """Updates internal running totals for the given doc."""
-        self._total_docs += 1
-        for fname in self.facet_terms.keys():
-            raw = doc.get(fname) or []
-            vals = [raw] if not isinstance(raw, (list, tuple)) else raw
-            for val in vals:
-                fval_group = self._facet_value_groups.get(fname, {})
-                fval_group[val] = fval_group.get(val, 0) + 1
-                self._facet_value_groups[fname] = fval_group
-        if self._total_docs == self.schema.num_docs:
-            self._finalize_facet_counts()
-
     def _finalize_facet_counts(self) -> None:
         """Generates final facet value counts from running totals."""
-        for fname in self.facet_terms.keys():
-            fval_group = self._facet_value_groups.get(fname, {})
-            counts = sorted(list(fval_group.items()), key=lambda x: x[1],
-                            reverse=True)
+        for fname in self._facet_names:
+            counts = self._facet_value_groups[fname].most_common()
             self._facet_value_counts[fname] = counts
         if self._fileset is not None:
             self._fileset.save_counts(self._total_docs,
@@ -658,7 +792,8 @@ class SchemaToFileSetLikeAdapter:
         if self.file_action in ('w', 'a'):
             overwrite = self.file_action == 'w'
             docs_iter = self._make_initial_docs_iterator()
-            return self._fileset.stream_docs_to_file(docs_iter, overwrite)
+            return self._fileset.stream_docs_to_file(docs_iter, overwrite,
+                                                     self.fsync_every)
         return self._fileset.docs
 
 
@@ -781,7 +916,8 @@ class DocSet:
     def from_schema(cls: Type[D],
                     docset_id: str,
                     schema: BenchmarkSchema,
-                    savepath: Optional[PathLike] = None) -> D:
+                    savepath: Optional[PathLike] = None,
+                    fsync_every: Optional[int] = None) -> D:
         """Creates a new DocSet instance from a BenchmarkSchema.
 
         This is a class factory method for instantiating DocSets. Use
@@ -796,8 +932,14 @@ class DocSet:
                 this is not provided, then documents are not saved to
                 disk. (Iterating through `docs` multiple times will
                 generate multiple sets of documents.)
-        """
-        source = SchemaToFileSetLikeAdapter(docset_id, schema, savepath)
+            fsync_every: (Optional.) If `savepath` is provided, new
+                documents are synced to disk (via `os.fsync`) once per
+                this many docs as they are generated and saved. See
+                `FileSet.stream_docs_to_file`. Default is None (never
+                sync explicitly).
+        """
+        source = SchemaToFileSetLikeAdapter(docset_id, schema, savepath,
+                                            fsync_every)
         return cls(source)
 
     @classmethod
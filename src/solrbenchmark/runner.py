@@ -1,23 +1,33 @@
 """Contains classes for running benchmarking tests and compiling stats."""
+from collections import defaultdict
 from dataclasses import asdict, dataclass, replace
+from itertools import islice
+import math
 from pathlib import Path
 import re
-from typing import Any, Dict, List, Mapping, Optional, Sequence, Type, TypeVar
+from typing import (
+    Any, DefaultDict, Dict, List, Mapping, Optional, Sequence, Tuple, Type,
+    TypeVar
+)
 
 from solrbenchmark.localtypes import (
-    BenchmarkLogReport, CompiledEventTimingsInfo, ConfigDataLike, PathLike,
-    PysolrConnLike, RawEventTimings, SearchResult, SearchSetResult,
+    BenchmarkLogReport, CompiledEventTimingsInfo, ConfigDataLike, Number,
+    PathLike, PysolrConnLike, RawEventTimings, SearchResult, SearchSetResult,
     SearchStats, Stats, StatsWithTimings, TermResult
 )
 
 from solrbenchmark.docs import DocSet
-import ujson
+import orjson
 
 
 C = TypeVar('C', bound='ConfigData')
 B = TypeVar('B', bound='BenchmarkLog')
 R = TypeVar('R', bound='BenchmarkRunner')
 
+# Matches the QTime value in a raw Solr response string, whether the
+# response is formatted as JSON or XML.
+_QTIME_RE = re.compile(r'QTime\D+(\d+)')
+
 
 @dataclass
 class ConfigData:
@@ -88,11 +98,7 @@ class ConfigData:
                 attribute.
             notes: (Optional.) See `notes` attribute.
         """
-        new_obj = replace(self)
-        new_obj.config_id = config_id
-        for arg, val in kwargs.items():
-            setattr(new_obj, arg, val)
-        return new_obj
+        return replace(self, config_id=config_id, **kwargs)
 
 
 def compose_log_json_filepath(basepath: PathLike,
@@ -108,7 +114,7 @@ def compose_log_json_filepath(basepath: PathLike,
         config_id: The unique ID str for the configuration used in the
             tests that created this log file.
     """
-    return Path(basepath) / f'{docset_id}--{config_id}-log.json'
+    return Path(basepath, f'{docset_id}--{config_id}-log.json')
 
 
 class BenchmarkLog:
@@ -239,14 +245,14 @@ class BenchmarkLog:
             The filepath as a pathlib.Path object.
         """
         self._filepath = Path(filepath)
-        json_str = ujson.dumps({
+        json_bytes = orjson.dumps({
             'docset_id': self.docset_id,
             'configdata': asdict(self.configdata),
             'indexing_stats': self.indexing_stats,
             'search_stats': self.search_stats
         })
-        with open(self._filepath, 'w') as json_fh:
-            json_fh.write(json_str)
+        with open(self._filepath, 'wb') as json_fh:
+            json_fh.write(json_bytes)
         return self._filepath
 
     @classmethod
@@ -263,9 +269,9 @@ class BenchmarkLog:
                 but it can be a subclass or any ConfigDataLike type
                 that stores your configuration data.
         """
-        with open(filepath) as f:
-            json_str = f.read()
-        data = ujson.loads(json_str)
+        with open(filepath, 'rb') as f:
+            json_bytes = f.read()
+        data = orjson.loads(json_bytes)
         configdata = cd_cls(**data['configdata'])
         bmark_log = cls(data['docset_id'], configdata)
         bmark_log.indexing_stats = data['indexing_stats']
@@ -378,6 +384,22 @@ class BenchmarkLog:
         i_stats = self.indexing_stats
         s_stats = self.search_stats
         i_avg_label = f"avg per {i_stats['batch_size']} docs"
+
+        # Each set's term results are scanned once, here. Aggregate
+        # groups are then built from these per-set numbers.
+        blank_qtimes: Dict[str, Number] = {}
+        qtime_totals: Dict[str, Number] = {}
+        qtime_counts: Dict[str, int] = {}
+        for label, details in s_stats.items():
+            term_results = details['term_results']
+            qtime_total: Number = 0
+            for tr in term_results:
+                if tr['term'] == '' and label not in blank_qtimes:
+                    blank_qtimes[label] = tr['qtime_ms']
+                qtime_total += tr['qtime_ms']
+            qtime_totals[label] = qtime_total
+            qtime_counts[label] = len(term_results)
+
         data: BenchmarkLogReport = {
             'ADD': {
                 'total': (i_stats.get('indexing_total_secs', 0), 's'),
@@ -392,71 +414,60 @@ class BenchmarkLog:
                 i_avg_label: (i_stats.get('average_secs', 0), 's')
             },
             'SEARCH': {
-                'BLANK': {},
-                'ALL TERMS': {}
+                'BLANK': {
+                    label: (blank_qtime, 'ms')
+                    for label, blank_qtime in blank_qtimes.items()
+                },
+                'ALL TERMS': {
+                    label: (details['avg_qtime_ms'], 'ms')
+                    for label, details in s_stats.items()
+                }
             }
         }
 
-        for label, details in s_stats.items():
-            term_results = details['term_results']
-            blanks = (tr for tr in term_results if tr['term'] == '')
-            blank = next(blanks, None)
-            if blank:
-                blank_qtime = blank['qtime_ms']
-                data['SEARCH']['BLANK'][label] = (blank_qtime, 'ms')
-            allterms_qtime = details['avg_qtime_ms']
-            data['SEARCH']['ALL TERMS'][label] = (allterms_qtime, 'ms')
-
         for grp_label, labels in aggregate_search_groups.items():
-            blank_tally = []
-            search_tally = []
-            for label in labels:
-                details = s_stats[label]
-                term_results = details['term_results']
-                blanks = (tr for tr in term_results if tr['term'] == '')
-                blank = next(blanks, None)
-                if blank:
-                    blank_tally.append(blank['qtime_ms'])
-                search_tally.extend(
-                    [tr['qtime_ms'] for tr in details['term_results']]
-                )
+            blank_tally = [
+                blank_qtimes[label] for label in labels
+                if label in blank_qtimes
+            ]
             if blank_tally:
                 grp_blank_qt = round(sum(blank_tally) / len(blank_tally), 4)
                 data['SEARCH']['BLANK'][grp_label] = (grp_blank_qt, 'ms')
-            grp_allterms_qt = round(sum(search_tally) / len(search_tally), 4)
+            grp_total = sum(qtime_totals[label] for label in labels)
+            grp_count = sum(qtime_counts[label] for label in labels)
+            if grp_count:
+                grp_allterms_qt = round(grp_total / grp_count, 4)
+            else:
+                grp_allterms_qt = 0
             data['SEARCH']['ALL TERMS'][grp_label] = (grp_allterms_qt, 'ms')
         return data
 
 
 def _scrape_qtime(solr_response: str) -> float:
     """Returns the query time (in seconds!) from a Solr response str."""
-    pattern = r'QTime\D+(\d+)'
-    qt_match = re.search(pattern, solr_response)
-    try:
-        qtime = qt_match.group(1)  # type: ignore[union-attr]
-    except AttributeError:
+    qt_match = _QTIME_RE.search(solr_response)
+    if qt_match is None:
         raise ValueError(
             f"Cannot scrape query time from Solr response string. Looking "
-            f"for pattern r'{pattern}' in: {solr_response}."
+            f"for pattern r'{_QTIME_RE.pattern}' in: {solr_response}."
         )
-    return int(qtime) * 0.001
+    return int(qt_match.group(1)) * 0.001
 
 
 def _compile_timings(timings: RawEventTimings) -> CompiledEventTimingsInfo:
     """Compiles timings from a sequence of raw (event, timing) tuples."""
+    event_timings: DefaultDict[str, List[Number]] = defaultdict(list)
+    for event, time in timings:
+        event_timings[event].append(time)
     stats: CompiledEventTimingsInfo = {
-        'timings': {},
+        'timings': dict(event_timings),
         'totals': {},
         'averages': {}
     }
-    default_time = 0
-    for event, time in timings:
-        stats['timings'][event] = stats['timings'].get(event, []) + [time]
-        total = stats['totals'].get(event, default_time) + time
+    for event, etimings in event_timings.items():
+        total = math.fsum(etimings)
         stats['totals'][event] = round(total, 6)
-    for event, event_timings in stats['timings'].items():
-        avg = stats['totals'][event] / len(event_timings)
-        stats['averages'][event] = round(avg, 6)
+        stats['averages'][event] = round(total / len(etimings), 6)
     return stats
 
 
@@ -468,27 +479,35 @@ def _compile_indexing_results(raw_timings: RawEventTimings,
     timings = tstats['timings']
     totals = tstats['totals']
     avgs = tstats['averages']
-    nbatches = len(timings['indexing'])
+    indexing_total = totals.get('indexing', 0)
+    commit_total = totals.get('committing', 0)
+    total = indexing_total + commit_total
+    nbatches = len(timings.get('indexing', []))
+    # There may be fewer commits than batches, so commit timings are
+    # averaged per batch rather than per commit.
     return {
         'batch_size': batch_size,
         'total_docs': ndocs,
-        'indexing_timings_secs': timings['indexing'],
-        'indexing_total_secs': totals['indexing'],
-        'indexing_average_secs': avgs['indexing'],
-        'commit_timings_secs': timings['committing'],
-        'commit_total_secs': totals['committing'],
-        'commit_average_secs': avgs['committing'],
-        'total_secs': totals['indexing'] + totals['committing'],
-        'average_secs': (totals['indexing'] + totals['committing']) / nbatches
+        'indexing_timings_secs': timings.get('indexing', []),
+        'indexing_total_secs': indexing_total,
+        'indexing_average_secs': avgs.get('indexing', 0),
+        'commit_timings_secs': timings.get('committing', []),
+        'commit_total_secs': commit_total,
+        'commit_average_secs': (
+            round(commit_total / nbatches, 6) if nbatches else 0
+        ),
+        'total_secs': total,
+        'average_secs': total / nbatches if nbatches else 0
     }
 
 
 def _compile_search_results(term_results: List[TermResult]) -> SearchSetResult:
     """Compiles qtime averages from qtimes in term results."""
-    qtime = sum([r['qtime_ms'] for r in term_results])
+    qtime = sum(r['qtime_ms'] for r in term_results)
+    nterms = len(term_results)
     return {
         'total_qtime_ms': round(qtime, 4),
-        'avg_qtime_ms': round(qtime / len(term_results), 4),
+        'avg_qtime_ms': round(qtime / nterms, 4) if nterms else 0,
         'term_results': term_results,
     }
 
@@ -674,7 +693,8 @@ class BenchmarkRunner:
     def index_docs(self,
                    docset: DocSet,
                    batch_size: int = 1000,
-                   verbose: bool = True) -> StatsWithTimings:
+                   verbose: bool = True,
+                   commit_every: int = 1) -> StatsWithTimings:
         """Runs indexing tests against the provided DocSet.
 
         Timings for adding documents to the index and committing them
@@ -683,9 +703,15 @@ class BenchmarkRunner:
         which here would count as part of the 'add' timings.
 
         Documents are added in batches, controlled by the `batch_size`
-        argument. Each batch is followed by a hard commit. E.g., with a
-        DocSet containing 100000 documents and a batch size of 1000, it
-        would index 100 batches of 1000 documents each.
+        argument. By default, each batch is followed by a hard commit.
+        E.g., with a DocSet containing 100000 documents and a batch
+        size of 1000, it would index 100 batches of 1000 documents
+        each. Use `commit_every` to commit less often -- e.g., with a
+        `commit_every` value of 10, it would index the same 100
+        batches but only commit after every 10th batch. A final commit
+        is always issued after the last batch. Commit timings are
+        averaged per batch, either way, so that they are comparable to
+        the 'add' timings.
 
         Docs are left indexed so that you can run search tests against
         the document set immediately following indexing tests.
@@ -701,6 +727,9 @@ class BenchmarkRunner:
             verbose: (Optional.) If True, brief status messages
                 indicating what documents are being indexed will be
                 printed to stdout as the tests run. Default is True.
+            commit_every: (Optional.) The number of batches to add
+                between hard commits. Default is 1 (commit after every
+                batch).
 
         Returns:
             A dict containing the stats from this indexing test run,
@@ -715,19 +744,18 @@ class BenchmarkRunner:
                     'average_secs': 15.242
                 }
         """
-        def _do(batch: List[Dict[str, Any]], i: int) -> RawEventTimings:
-            timings: RawEventTimings = []
+        def _add(batch: List[Dict[str, Any]],
+                 start: int) -> Tuple[str, float]:
             if verbose:
-                print(f'Indexing {i + 1 - batch_size} to {i}.')
+                print(f'Indexing {start} to {start + len(batch) - 1}.')
             index_response = self.conn.add(batch, commit=False)
-            index_qtime = _scrape_qtime(index_response)
-            timings.append(('indexing', index_qtime))
+            return ('indexing', _scrape_qtime(index_response))
+
+        def _commit() -> Tuple[str, float]:
             if verbose:
                 print('Committing...')
             commit_response = self.conn.commit()
-            commit_qtime = _scrape_qtime(commit_response)
-            timings.append(('committing', commit_qtime))
-            return timings
+            return ('committing', _scrape_qtime(commit_response))
 
         if not self.is_configured:
             raise RunnerConfigurationError(
@@ -746,18 +774,34 @@ class BenchmarkRunner:
                 f"The 'id' of the given docset (`{docset.id}`) does not match "
                 f"the configured 'docset_id' (`{log_docset_id}`)."
             )
+        if commit_every < 1:
+            raise ValueError(
+                f"The 'commit_every' argument must be at least 1; "
+                f"`{commit_every}` was given."
+            )
 
         timings: RawEventTimings = []
-        batch: List[Dict[str, Any]] = []
-        for i, doc in enumerate(docset.docs):
-            if verbose and i % batch_size == 0:
+        docs = iter(docset.docs)
+        start = 0
+        uncommitted = 0
+        while True:
+            # Pull the first doc of each batch on its own, so that the
+            # progress message prints before the rest of the batch is
+            # generated, which may take a while.
+            batch = list(islice(docs, 1))
+            if not batch:
+                break
+            if verbose:
                 print('Gathering docs.')
-            batch.append(doc)
-            if (i + 1) % batch_size == 0:
-                timings.extend(_do(batch, i))
-                batch = []
-        if batch:
-            timings.extend(_do(batch, i))
+            batch.extend(islice(docs, batch_size - 1))
+            timings.append(_add(batch, start))
+            start += len(batch)
+            uncommitted += 1
+            if uncommitted == commit_every:
+                timings.append(_commit())
+                uncommitted = 0
+        if uncommitted:
+            timings.append(_commit())
 
         total = docset.total_docs
         stats = _compile_indexing_results(timings, total, batch_size)
@@ -801,19 +845,21 @@ class BenchmarkRunner:
               first `ignore_n` repetitions.
         """
         q = q or blank_q
-        timings: RawEventTimings = []
-        hits = 0
-        for i in range(rep_n):
-            if i < ignore_n:
-                result = self.conn.search(q=q, **kwargs)
-            else:
-                result = self.conn.search(q=q, **kwargs)
-                hits = hits or result.hits
-                timings.append(('search', result.qtime))
-        tstats = _compile_timings(timings)
+        ignore_n = min(ignore_n, rep_n)
+        for _ in range(ignore_n):
+            result = self.conn.search(q=q, **kwargs)
+        qtimes: List[Number] = []
+        for _ in range(rep_n - ignore_n):
+            result = self.conn.search(q=q, **kwargs)
+            qtimes.append(result.qtime)
         # The canonical query time for this search is the average of
         # the repetitions, excluding the ones we ignored.
-        qtime_ms = round(tstats['averages'].get('search', 0), 4)
+        if qtimes:
+            hits = result.hits
+            qtime_ms = round(sum(qtimes) / len(qtimes), 4)
+        else:
+            hits = 0
+            qtime_ms = 0
         return {
             'result': result,
             'hits': hits,
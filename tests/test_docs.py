@@ -83,6 +83,19 @@ def test_fileset_get_nonexistent_data(tmpdir, fileset_check):
                   exp_tdocs=0, exp_fvcounts=None)
 
 
+@pytest.mark.parametrize('contents', [b'', b'\n', b'{"search_terms": ['])
+def test_fileset_get_empty_or_invalid_data(contents, tmpdir):
+    # A 'terms' or 'counts' file that is empty or does not contain
+    # valid JSON should be treated as if it has no data.
+    fset = docs.FileSet(tmpdir, 'testing_invalid_data')
+    fset.terms_filepath.write_bytes(contents)
+    fset.counts_filepath.write_bytes(contents)
+    assert fset.search_terms is None
+    assert fset.facet_terms is None
+    assert fset.total_docs == 0
+    assert fset.facet_value_counts is None
+
+
 def test_fileset_filepaths(tmpdir):
     fset = docs.FileSet(tmpdir, 'testing_filenames')
     assert fset.terms_filepath == tmpdir / 'testing_filenames_terms.json'
@@ -233,6 +246,133 @@ def test_fileset_save_and_overwrite_counts(old_tdocs, old_fvcounts, new_tdocs,
                   exp_fvcounts=exp_new_fvcounts)
 
 
+def test_fileset_save_terms_and_counts_reads_once(tmpdir, fileset_check,
+                                                  monkeypatch):
+    # Once a FileSet has loaded (or saved) its 'terms' or 'counts'
+    # data, later saves should update that in-memory data rather than
+    # reading the file from disk again.
+    fset = docs.FileSet(tmpdir, 'testing_save_reads_once')
+    get_data = Mock(wraps=docs._get_data)
+    monkeypatch.setattr(docs, '_get_data', get_data)
+    fset.save_terms(search_terms=['one', 'two'])
+    fset.save_terms(facet_terms={'colors': ['red', 'blue']})
+    fset.save_counts(total_docs=2)
+    fset.save_counts(facet_value_counts={'colors': [('red', 2)]})
+    assert get_data.call_count == 2
+    monkeypatch.undo()
+    fileset_check(docs.FileSet(tmpdir, 'testing_save_reads_once'),
+                  termsfile_exists=True, termsfile_is_empty=False,
+                  countsfile_exists=True, countsfile_is_empty=False,
+                  exp_search=['one', 'two'],
+                  exp_facet={'colors': ['red', 'blue']}, exp_tdocs=2,
+                  exp_fvcounts={'colors': [('red', 2)]})
+
+
+def test_fileset_save_all_terms_and_counts_no_read(tmpdir, fileset_check,
+                                                   monkeypatch):
+    # Saving both values in the 'terms' or 'counts' file replaces the
+    # file's contents entirely, so the file should not be read first.
+    fset = docs.FileSet(tmpdir, 'testing_save_all_no_read')
+    fset.save_terms(search_terms=['zero'], facet_terms={})
+    fset.save_counts(total_docs=0, facet_value_counts={})
+    fset = docs.FileSet(tmpdir, 'testing_save_all_no_read')
+    get_data = Mock(wraps=docs._get_data)
+    monkeypatch.setattr(docs, '_get_data', get_data)
+    fset.save_terms(['one', 'two'], {'colors': ['red', 'blue']})
+    fset.save_counts(2, {'colors': [('red', 2)]})
+    assert get_data.call_count == 0
+    monkeypatch.undo()
+    fileset_check(docs.FileSet(tmpdir, 'testing_save_all_no_read'),
+                  termsfile_exists=True, termsfile_is_empty=False,
+                  countsfile_exists=True, countsfile_is_empty=False,
+                  exp_search=['one', 'two'],
+                  exp_facet={'colors': ['red', 'blue']}, exp_tdocs=2,
+                  exp_fvcounts={'colors': [('red', 2)]})
+
+
+def test_fileset_save_after_file_changed_elsewhere(tmpdir, fileset_check):
+    # If another FileSet changes the 'terms' or 'counts' file after
+    # this one has loaded it, saving should merge into the changed
+    # file rather than overwrite it with stale in-memory data.
+    fset1 = docs.FileSet(tmpdir, 'testing_changed_elsewhere')
+    fset2 = docs.FileSet(tmpdir, 'testing_changed_elsewhere')
+    fset1.save_terms(search_terms=['one'])
+    fset1.save_counts(total_docs=1)
+    fset2.save_terms(facet_terms={'colors': ['red', 'blue']})
+    fset2.save_counts(facet_value_counts={'colors': [('red', 1)]})
+    fset1.save_terms(search_terms=['one', 'two'])
+    fset1.save_counts(total_docs=2)
+    fileset_check(docs.FileSet(tmpdir, 'testing_changed_elsewhere'),
+                  termsfile_exists=True, termsfile_is_empty=False,
+                  countsfile_exists=True, countsfile_is_empty=False,
+                  exp_search=['one', 'two'],
+                  exp_facet={'colors': ['red', 'blue']}, exp_tdocs=2,
+                  exp_fvcounts={'colors': [('red', 1)]})
+
+
+def test_fileset_terms_properties_read_once(tmpdir, monkeypatch):
+    # Accessing `search_terms` and `facet_terms` should read the
+    # 'terms' file once, even when one of them is not in the file.
+    docs.FileSet(tmpdir, 'testing_terms_read_once').save_terms(
+        search_terms=['one', 'two']
+    )
+    fset = docs.FileSet(tmpdir, 'testing_terms_read_once')
+    get_data = Mock(wraps=docs._get_data)
+    monkeypatch.setattr(docs, '_get_data', get_data)
+    assert fset.search_terms == ['one', 'two']
+    assert fset.facet_terms is None
+    assert fset.facet_terms is None
+    assert fset.search_terms == ['one', 'two']
+    assert get_data.call_count == 1
+
+
+def test_fileset_terms_saved_elsewhere_after_read(tmpdir):
+    # If another FileSet saves the 'terms' file after this one has
+    # already read it (or found it missing), this one should see the
+    # new terms rather than the cached ones.
+    fset1 = docs.FileSet(tmpdir, 'testing_terms_saved_elsewhere')
+    assert fset1.search_terms is None
+    assert fset1.facet_terms is None
+    fset2 = docs.FileSet(tmpdir, 'testing_terms_saved_elsewhere')
+    fset2.save_terms(['one', 'two'], {'colors': ['red', 'blue']})
+    assert fset1.search_terms == ['one', 'two']
+    assert fset1.facet_terms == {'colors': ['red', 'blue']}
+    fset2.save_terms(search_terms=['three'])
+    assert fset1.search_terms == ['three']
+
+
+def test_fileset_counts_properties_read_once(tmpdir, monkeypatch):
+    # Accessing `total_docs` and `facet_value_counts` should read the
+    # 'counts' file once, even when `total_docs` is 0 or
+    # `facet_value_counts` is not in the file.
+    docs.FileSet(tmpdir, 'testing_counts_read_once').save_counts(
+        total_docs=0
+    )
+    fset = docs.FileSet(tmpdir, 'testing_counts_read_once')
+    get_data = Mock(wraps=docs._get_data)
+    monkeypatch.setattr(docs, '_get_data', get_data)
+    assert fset.total_docs == 0
+    assert fset.facet_value_counts is None
+    assert fset.total_docs == 0
+    assert fset.facet_value_counts is None
+    assert get_data.call_count == 1
+
+
+def test_fileset_counts_saved_elsewhere_after_read(tmpdir):
+    # If another FileSet saves the 'counts' file after this one has
+    # already read it (or found it missing), this one should see the
+    # new counts rather than the cached ones.
+    fset1 = docs.FileSet(tmpdir, 'testing_counts_saved_elsewhere')
+    assert fset1.total_docs == 0
+    assert fset1.facet_value_counts is None
+    fset2 = docs.FileSet(tmpdir, 'testing_counts_saved_elsewhere')
+    fset2.save_counts(5, {'colors': [('red', 3), ('blue', 2)]})
+    assert fset1.total_docs == 5
+    assert fset1.facet_value_counts == {'colors': [['red', 3], ['blue', 2]]}
+    fset2.save_counts(total_docs=10)
+    assert fset1.total_docs == 10
+
+
 @pytest.mark.parametrize('overwrite', [
     True,
     False
@@ -261,21 +401,109 @@ def test_fileset_get_saved_docs(tmpdir, fileset_check):
                   exp_docs=test_docs)
 
 
-def test_fileset_access_docs_during_streaming(tmpdir):
+@pytest.mark.parametrize('read_size', [1, 7, 32, 1 << 20])
+def test_fileset_get_saved_docs_read_size(read_size, tmpdir, monkeypatch):
+    # Saved docs are read from disk in blocks of bytes, which will not
+    # line up with the boundaries between docs. No matter the block
+    # size, each doc should be loaded intact.
+    monkeypatch.setattr(docs, '_DOCS_READ_SIZE', read_size)
+    test_docs = [{'id': 1, 'title': 'Test Doc 1', 'tags': ['one', 'two']},
+                 {'id': 2, 'title': 'Tést Dóc 2', 'tags': None},
+                 {'id': 3, 'title': 'Test Doc 3', 'tags': ['three']}]
+    fset = docs.FileSet(tmpdir, 'testing_docs_read_size')
+    _ = list(fset.stream_docs_to_file(test_docs))
+    assert list(fset.docs) == test_docs
+
+
+@pytest.mark.parametrize('write_size, stop_after', [
+    (1, 5),
+    (1, 3),
+    (64, 5),
+    (64, 3),
+    (64, 0),
+    (1 << 20, 3),
+])
+def test_fileset_stream_docs_in_batches(write_size, stop_after, tmpdir,
+                                        monkeypatch):
+    # Streamed docs are buffered and written to disk in batches.
+    # Whatever docs have been yielded should be saved once the iterator
+    # is closed, even if iteration stops partway through a batch.
+    monkeypatch.setattr(docs, '_DOCS_WRITE_SIZE', write_size)
+    test_docs = [{'id': i, 'title': f'Test Doc {i}'} for i in range(5)]
+    fset = docs.FileSet(tmpdir, 'testing_docs_batches')
+    stream = fset.stream_docs_to_file(test_docs)
+    streamed = list(itertools.islice(stream, stop_after))
+    stream.close()
+    assert streamed == test_docs[:stop_after]
+    assert list(fset.docs) == test_docs[:stop_after]
+
+
+@pytest.mark.parametrize('write_size, fsync_every, num_docs, exp_syncs', [
+    (64, None, 5, 0),
+    (64, 2, 4, 2),
+    (64, 2, 5, 3),
+    (64, 1, 3, 3),
+    (64, 3, 7, 3),
+    (1, 3, 7, 3),
+    (1 << 20, 5, 5, 1),
+    (1 << 20, 5, 0, 0),
+])
+def test_fileset_stream_docs_fsync_every(write_size, fsync_every, num_docs,
+                                         exp_syncs, tmpdir, monkeypatch):
+    # If `fsync_every` is set, streamed docs should be synced to disk
+    # after each `fsync_every` docs, plus once more for any remaining
+    # docs when iteration stops.
+    monkeypatch.setattr(docs, '_DOCS_WRITE_SIZE', write_size)
+    fsync = Mock()
+    monkeypatch.setattr(docs.os, 'fsync', fsync)
+    test_docs = [{'id': i, 'title': f'Test Doc {i}'} for i in range(num_docs)]
+    fset = docs.FileSet(tmpdir, 'testing_docs_fsync_every')
+    _ = list(fset.stream_docs_to_file(test_docs, fsync_every=fsync_every))
+    assert fsync.call_count == exp_syncs
+    assert list(fset.docs) == test_docs
+
+
+@pytest.mark.parametrize('fsync_every', [0, -1])
+def test_fileset_stream_docs_invalid_fsync_every(fsync_every, tmpdir):
+    # An `fsync_every` value less than 1 should raise an error as soon
+    # as `stream_docs_to_file` is called, without touching the file.
+    fset = docs.FileSet(tmpdir, 'testing_docs_invalid_fsync_every')
+    with pytest.raises(ValueError) as excinfo:
+        fset.stream_docs_to_file([{'id': 1}], fsync_every=fsync_every)
+    assert "'fsync_every' argument must be at least 1" in str(excinfo.value)
+    assert not fset.docs_filepath.exists()
+
+
+@pytest.mark.parametrize('fsync_every, exp_visible_while_streaming', [
+    (None, [0, 0, 0]),
+    (1, [1, 2, 3]),
+    (2, [0, 2, 2]),
+])
+def test_fileset_access_docs_during_streaming(fsync_every,
+                                              exp_visible_while_streaming,
+                                              tmpdir):
     # Attempting to access a fileset's docs while in the middle of
     # streaming new docs to disk should not create a conflict. Each
     # time you access the `docs` attribute, it gives you a new
-    # generator that iterates through whatever docs have been saved up
-    # to that point.
+    # generator that iterates through the docs that have reached the
+    # file so far. Docs are buffered and only flushed in whole-doc
+    # chunks, so while streaming is underway a reader sees some prefix
+    # of the streamed docs (possibly none); once streaming finishes, it
+    # sees all of them.
     test_docs = [{'id': 1, 'title': 'Test Doc 1', 'tags': ['one', 'two']},
                  {'id': 2, 'title': 'Test Doc 2', 'tags': None},
                  {'id': 3, 'title': 'Test Doc 3', 'tags': None}]
     fset = docs.FileSet(tmpdir, 'testing_docs_access_during_streaming')
     expected = []
-    for in_doc in fset.stream_docs_to_file(test_docs):
+    visible_while_streaming = []
+    for in_doc in fset.stream_docs_to_file(test_docs,
+                                           fsync_every=fsync_every):
         expected.append(in_doc)
-        for out_doc in fset.docs:
-            assert out_doc in expected
+        out_docs = list(fset.docs)
+        assert out_docs == expected[:len(out_docs)]
+        visible_while_streaming.append(len(out_docs))
+    assert visible_while_streaming == exp_visible_while_streaming
+    assert list(fset.docs) == test_docs
 
 
 def test_fileset_save_then_overwrite_docs(tmpdir, fileset_check):
@@ -374,6 +602,22 @@ def test_fileset_clear_nonexistent_files(tmpdir, fileset_check):
                   exp_tdocs=0, exp_fvcounts=None)
 
 
+def test_fileset_clear_some_files_missing(tmpdir, fileset_check):
+    # If `clear` is called and some files exist but others do not, the
+    # files that exist should still be deleted.
+    docset_id = 'testing_clearing_some_files_missing'
+    test_docs = [{'id': 1, 'title': 'Test Doc 1'}]
+    fset = docs.FileSet(tmpdir, docset_id)
+    _ = list(fset.stream_docs_to_file(test_docs))
+    fset.save_counts(1, {})
+    fset.clear()
+    fileset_check(fset, termsfile_exists=False, termsfile_is_empty=True,
+                  docsfile_exists=False, docsfile_is_empty=True,
+                  countsfile_exists=False, countsfile_is_empty=True,
+                  exp_search=None, exp_facet=None, exp_docs=None,
+                  exp_tdocs=0, exp_fvcounts=None)
+
+
 def test_fileset_multiple_different_filesets_at_once(tmpdir, fileset_check):
     # Filesets are identified by their basepath and id; you can have
     # different filesets at one time at the same basepath, provided
@@ -654,6 +898,46 @@ def test_docset_fromschema_w_savepath_overwrite(tmpdir, fileset_check,
                   exp_docs=w_results, exp_tdocs=5, exp_fvcounts=w_fv_counts)
 
 
+@pytest.mark.parametrize('fsync_every, exp_syncs', [
+    (None, 0),
+    (1, 5),
+    (2, 3),
+    (5, 1),
+])
+def test_docset_fromschema_w_savepath_fsync_every(fsync_every, exp_syncs,
+                                                  tmpdir, simple_schema,
+                                                  monkeypatch):
+    # Passing `fsync_every` to `from_schema` should sync generated docs
+    # to disk as they are saved, the same as passing it to
+    # `FileSet.stream_docs_to_file`. Reading them back should not sync.
+    fsync = Mock()
+    monkeypatch.setattr(docs.os, 'fsync', fsync)
+    myschema = simple_schema(5, 0.5, 0.5, 999)
+    docset = docs.DocSet.from_schema('test-docset', myschema, savepath=tmpdir,
+                                     fsync_every=fsync_every)
+    assert docset.source.fsync_every == fsync_every
+    results = list(docset.docs)
+    assert fsync.call_count == exp_syncs
+    assert list(docset.docs) == results
+    assert fsync.call_count == exp_syncs
+
+
+def test_docset_fromschema_set_fsync_every_attribute(tmpdir, simple_schema,
+                                                     monkeypatch):
+    # Like `file_action`, `fsync_every` can be changed on the source
+    # between passes.
+    fsync = Mock()
+    monkeypatch.setattr(docs.os, 'fsync', fsync)
+    myschema = simple_schema(5, 0.5, 0.5, 999)
+    docset = docs.DocSet.from_schema('test-docset', myschema, savepath=tmpdir)
+    _ = list(docset.docs)
+    assert fsync.call_count == 0
+    docset.source.file_action = 'w'
+    docset.source.fsync_every = 2
+    _ = list(docset.docs)
+    assert fsync.call_count == 3
+
+
 def test_docset_fromschema_w_savepath_append(tmpdir, fileset_check,
                                              simple_schema):
     myschema = simple_schema(5, 0.5, 0.5, None)
@@ -75,6 +75,11 @@ def test_configdata_derive(configdata):
             assert getattr(new_configdata, field_name) == val
 
 
+def test_configdata_derive_invalid_field(configdata):
+    with pytest.raises(TypeError):
+        configdata.derive('new-configset', not_a_field='Invalid')
+
+
 def test_benchmarklog_saveto_and_loadfrom_jsonfile(configdata, tmpdir):
     docset_id = 'test-docset'
     istats = {'indexing': ['test']}
@@ -237,6 +242,34 @@ def test_benchmarklog_compilereport(configdata):
     assert tlog.compile_report(aggregate_search_groups) == expected_report
 
 
+def test_benchmarklog_compilereport_empty_search_sets(configdata):
+    # Search sets with no terms have an average qtime of 0, and an
+    # aggregate group made only of such sets should, too, rather than
+    # raising a ZeroDivisionError.
+    tlog = runner.BenchmarkLog('test-docset', configdata)
+    tlog.indexing_stats = {'batch_size': 1000}
+    tlog.search_stats = {
+        'a': runner._compile_search_results([]),
+        'b': runner._compile_search_results([]),
+        'c': runner._compile_search_results([
+            {'term': '', 'hits': 10, 'qtime_ms': 20},
+            {'term': 'one', 'hits': 1, 'qtime_ms': 10},
+        ]),
+    }
+    report = tlog.compile_report({'empty': ['a', 'b'], 'mixed': ['a', 'c']})
+    assert report['SEARCH']['BLANK'] == {
+        'c': (20, 'ms'),
+        'mixed': (20, 'ms')
+    }
+    assert report['SEARCH']['ALL TERMS'] == {
+        'a': (0, 'ms'),
+        'b': (0, 'ms'),
+        'c': (15, 'ms'),
+        'empty': (0, 'ms'),
+        'mixed': (15, 'ms')
+    }
+
+
 def test_benchmarkrunner_no_logbasepath_save_error(configdata, new_mockconn):
     mockconn = new_mockconn()
     trunner = runner.BenchmarkRunner(mockconn).configure('test', configdata)
@@ -383,6 +416,105 @@ def test_benchmarkrunner_indexdocs(configdata, simple_schema, new_mockconn,
     mockconn.commit.assert_has_calls([call()] * int(num_docs / batch_size))
 
 
+def test_benchmarkrunner_indexdocs_verbose_output_order(configdata,
+                                                       new_mockconn,
+                                                       capsys):
+    # In verbose mode, "Gathering docs." should print as soon as the
+    # first doc in a batch is generated, before the rest of the batch
+    # is generated and well before it is indexed.
+    def docs_gen():
+        for i in range(5):
+            print(f'Generating doc {i}.')
+            yield {'id': i}
+
+    mockconn = new_mockconn()
+    trunner = runner.BenchmarkRunner(mockconn).configure('test', configdata)
+    docset = Mock(id='test', docs=docs_gen(), total_docs=5)
+    trunner.index_docs(docset, batch_size=3, verbose=True)
+    assert capsys.readouterr().out.splitlines() == [
+        'Generating doc 0.',
+        'Gathering docs.',
+        'Generating doc 1.',
+        'Generating doc 2.',
+        'Indexing 0 to 2.',
+        'Committing...',
+        'Generating doc 3.',
+        'Gathering docs.',
+        'Generating doc 4.',
+        'Indexing 3 to 4.',
+        'Committing...',
+    ]
+
+
+@pytest.mark.parametrize('commit_every, num_docs, exp_commits', [
+    (1, 50, 5),
+    (2, 50, 3),
+    (2, 40, 2),
+    (5, 50, 1),
+    (10, 50, 1),
+    (2, 45, 3),
+])
+def test_benchmarkrunner_indexdocs_commit_every(commit_every, num_docs,
+                                                exp_commits, configdata,
+                                                simple_schema, new_mockconn):
+    # With `commit_every`, docs are committed after every Nth batch
+    # and after the last batch. Commit timings are still averaged per
+    # batch.
+    batch_size = 10
+    num_batches = -(-num_docs // batch_size)
+    myschema = simple_schema(num_docs, 0.5, 0.5, 999)
+    tdocset = docs.DocSet.from_schema('test-docset', myschema)
+    mockconn = new_mockconn(index_qts=[9372, 2295, 11972, 5060, 8333],
+                            commit_qts=[542, 368, 270, 985, 104])
+    tr = runner.BenchmarkRunner(mockconn).configure(tdocset.id, configdata)
+    stats = tr.index_docs(tdocset, batch_size=batch_size, verbose=False,
+                          commit_every=commit_every)
+    c_total = sum(stats['commit_timings_secs'])
+    assert mockconn.add.call_count == num_batches
+    assert mockconn.commit.call_count == exp_commits
+    assert len(stats['indexing_timings_secs']) == num_batches
+    assert len(stats['commit_timings_secs']) == exp_commits
+    assert round(stats['commit_total_secs'], 4) == round(c_total, 4)
+    assert round(stats['commit_average_secs'], 4) == round(
+        c_total / num_batches, 4
+    )
+
+
+@pytest.mark.parametrize('commit_every', [0, -1])
+def test_benchmarkrunner_indexdocs_invalid_commit_every(commit_every,
+                                                        configdata,
+                                                        new_mockconn):
+    mockconn = new_mockconn()
+    trunner = runner.BenchmarkRunner(mockconn).configure('test', configdata)
+    docset = Mock(id='test')
+    with pytest.raises(ValueError) as excinfo:
+        trunner.index_docs(docset, commit_every=commit_every)
+    assert "'commit_every' argument must be at least 1" in str(excinfo.value)
+
+
+def test_benchmarkrunner_indexdocs_empty_docset(configdata, new_mockconn):
+    # Indexing an empty docset should not add or commit anything, and
+    # it should return zeroed stats rather than raising an error.
+    mockconn = new_mockconn()
+    trunner = runner.BenchmarkRunner(mockconn).configure('test', configdata)
+    docset = Mock(id='test', docs=iter([]), total_docs=0)
+    stats = trunner.index_docs(docset, batch_size=10, verbose=False)
+    assert mockconn.add.call_count == 0
+    assert mockconn.commit.call_count == 0
+    assert stats == {
+        'batch_size': 10,
+        'total_docs': 0,
+        'indexing_timings_secs': [],
+        'indexing_total_secs': 0,
+        'indexing_average_secs': 0,
+        'commit_timings_secs': [],
+        'commit_total_secs': 0,
+        'commit_average_secs': 0,
+        'total_secs': 0,
+        'average_secs': 0
+    }
+
+
 def test_benchmarkrunner_indexdocs_not_configured(new_mockconn):
     mockconn = new_mockconn()
     trunner = runner.BenchmarkRunner(mockconn)
@@ -472,8 +604,11 @@ def test_benchmarkrunner_search_blankq(configdata, new_mockconn):
       'avg_qtime_ms': 311.4,
       'term_results': [{'term': '', 'hits': 15000, 'qtime_ms': 466.6},
                        {'term': 'one', 'hits': 10, 'qtime_ms': 101.6},
-                       {'term': 'two', 'hits': 150, 'qtime_ms': 366.0}]})
-
+                       {'term': 'two', 'hits': 150, 'qtime_ms': 366.0}]}),
+    ({}, {'fq': 'facet:value'}, 5, 0,
+     {'total_qtime_ms': 0,
+      'avg_qtime_ms': 0,
+      'term_results': []}),
 ])
 def test_benchmarkrunner_runsearches(terminfo, qkwargs, rep_n, ignore_n,
                                      exp_stats, new_mockconn, configdata):